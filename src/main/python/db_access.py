@@ -0,0 +1,147 @@
+"""Thread-aware SQLite3 connection management."""
+__author__ = "Fredrik Boulund"
+__date__ = "2018"
+
+from pathlib import Path
+import logging
+import sqlite3
+import threading
+import queue
+
+# Applied to every connection. WAL lets readers in other threads and
+# processes (e.g. the export window) run while the scanner writes;
+# synchronous=NORMAL is durable enough in WAL mode and avoids an fsync
+# per scan.
+PRAGMAS = [
+    ("mmap_size", 256 * 1024 * 1024),
+    ("cache_size", -16 * 1024),  # negative means KiB, i.e. 16 MiB
+    ("temp_store", "MEMORY"),
+]
+WRITE_PRAGMAS = [
+    # Only takes effect on a new, empty DB and must precede journal_mode,
+    # which writes the DB header; existing DBs are converted by compact()
+    ("auto_vacuum", "INCREMENTAL"),
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+]
+# Prepared statements cached per connection (sqlite3 keys them by SQL
+# text). Sized for the hot queries against both the live DB and the archive.
+STATEMENT_CACHE_SIZE = 256
+
+
+def readonly_uri(path):
+    """
+    SQLite URI opening path read-only.
+    """
+    return Path(path).resolve().as_uri() + "?mode=ro"
+
+
+class ConnectionManager():
+    """
+    Hands out one SQLite3 connection per thread for a database file, each
+    set up with the same PRAGMA profile and statement cache. sqlite3
+    connections may only be used by the thread that created them.
+
+    Read-only managers open the file with mode=ro and never write, so they
+    can be used for browsing and exports alongside a writer.
+    """
+
+    def __init__(self, dbfile, readonly=False, on_connect=None):
+        self.dbfile = Path(dbfile)
+        self.readonly = readonly
+        self.on_connect = on_connect
+        self._local = threading.local()
+
+    def connection(self):
+        """
+        Connection for the calling thread, created on first use.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        """
+        Close the calling thread's connection.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _connect(self):
+        if self.readonly:
+            connection = sqlite3.connect(
+                readonly_uri(self.dbfile),
+                uri=True,
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+            pragmas = PRAGMAS
+        else:
+            connection = sqlite3.connect(
+                str(self.dbfile),
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+            pragmas = WRITE_PRAGMAS + PRAGMAS
+        for pragma, value in pragmas:
+            connection.execute("PRAGMA {} = {}".format(pragma, value)).fetchall()
+        logging.debug("Opened %s connection to %s in thread %s",
+            "read-only" if self.readonly else "read-write",
+            self.dbfile,
+            threading.current_thread().name,
+        )
+        if self.on_connect:
+            self.on_connect(connection)
+        return connection
+
+
+class DBWorker():
+    """
+    Runs database jobs one at a time, in submission order, on a dedicated
+    thread so that they never block the caller (e.g. the Qt main thread).
+    Jobs using a ScannedSampleDB get the worker thread's own connection.
+
+    done callbacks and on_error are called from the worker thread, so GUI
+    code should pass something thread-safe such as a Qt signal's emit.
+    """
+
+    def __init__(self, on_error=None, name="db-worker"):
+        self.on_error = on_error
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """
+        Finish the jobs already submitted, then stop the worker thread.
+        """
+        if not self._thread.is_alive():
+            return
+        self._jobs.put(None)
+        self._thread.join()
+
+    def submit(self, job, *args, done=None):
+        """
+        Queue job(*args), passing its return value to done when finished.
+        """
+        self._jobs.put((job, args, done))
+
+    def _run(self):
+        while True:
+            queued = self._jobs.get()
+            if queued is None:
+                break
+            job, args, done = queued
+            try:
+                result = job(*args)
+            except Exception as e:
+                logging.exception("Database job %s failed", getattr(job, "__name__", job))
+                if self.on_error:
+                    self.on_error("{}: {}".format(type(e).__name__, e))
+                continue
+            if done:
+                done(result)
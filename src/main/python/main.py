@@ -5,8 +5,14 @@ __date__ = "2018"
 __version__ = "0.4.0b"
 
 from datetime import datetime
+from functools import partial
+from itertools import groupby
+from collections import namedtuple
 from pathlib import Path
+import logging
+import time
 import sys
+import os
 
 from fbs_runtime.application_context import ApplicationContext, cached_property
 from PyQt5 import QtCore
@@ -22,7 +28,25 @@ import pandas._libs.tslibs.np_datetime
 import pandas._libs.tslibs.nattype
 import pandas._libs.skiplist
 
-from sample_list import SampleList, ScannedSampleDB, __version__ as sample_list_version
+from sample_list import SampleList, ScannedSampleDB, DATETIME_FMT, is_empty_well, __version__ as sample_list_version
+from db_access import DBWorker
+from session_archive import SessionArchiver
+from scanner_input import ScanEvent, ScanPipeline, SerialScanner
+
+# Sessions older than this are moved out of the live DB in the background
+# after startup, into the archive DB tagged by ARCHIVE_PERIOD ("year" or "month").
+ARCHIVE_MAX_AGE_DAYS = 365
+ARCHIVE_PERIOD = "year"
+# Repeated scans of the same barcode within this many seconds are treated
+# as accidental double reads and ignored.
+SCAN_DUPLICATE_WINDOW = 1.0
+# Serial/tty barcode scanners to read in addition to the keyboard, separated
+# by os.pathsep, e.g. CTMR_SCANNER_DEVICES=/dev/ttyACM0:/dev/ttyUSB0
+SCANNER_DEVICES = [
+    device for device in os.environ.get("CTMR_SCANNER_DEVICES", "").split(os.pathsep) if device
+]
+# Selections a scan is processed with, captured when the item is scanned
+ScanContext = namedtuple("ScanContext", ["scantype", "sample_type", "box"])
 
 class AppContext(ApplicationContext):           # 1. Subclass ApplicationContext
     def run(self):                              # 2. Implement run()
@@ -39,7 +63,12 @@ class AppContext(ApplicationContext):           # 1. Subclass ApplicationContext
 
 
 class MainWindow(QWidget):
-    def __init__(self):
+    # Emitted once searched scans have been logged, with a list of
+    # (ScanEvent, Item) pairs, and for each scan dropped as a double read
+    scans_searched = QtCore.pyqtSignal(object)
+    scan_dropped = QtCore.pyqtSignal(object)
+
+    def __init__(self, dbfile="CTMR_scanned_items.sqlite3"):
         super().__init__()
         self.keyPressEvent = self._keypress_event_action  # Define custom handling of keypress events
         self.focusNextPrevChild = lambda x: False  # Disable Qt intercepting TAB keypress event
@@ -47,8 +76,12 @@ class MainWindow(QWidget):
         self.fluidx = ""
         self.search_list = ""
         self.sample_list = None
-        self.dbfile = "CTMR_scanned_items.sqlite3"
-        self.db = ScannedSampleDB(dbfile=self.dbfile)
+        # Search list whose load is queued on the DB worker, if any
+        self._pending_search_list = None
+        self._search_completed = False
+        self.dbfile = dbfile
+        # Indexes and summaries are brought up to date on the DB worker below
+        self.db = ScannedSampleDB(dbfile=self.dbfile, prepare=False)
         self._session_saved = False
 
         pixmap_art = QPixmap(appctxt.get_resource("bacteria.png")).scaledToHeight(50)
@@ -178,7 +211,34 @@ class MainWindow(QWidget):
         self.session_log("Started CTMR List Scanner version {} (SampleList: version {})".format(
             __version__, sample_list_version,
         ))
+
+        # Scans from the keyboard and serial scanners are queued and debounced
+        # on a background thread and handed back to process_scans in batches.
+        # Their DB lookups and writes, like all other writes to the DB, run on
+        # the DB worker thread, which only sends results back to the GUI thread.
+        self._scan_dispatcher = ScanDispatcher()
+        self._scan_dispatcher.scans_ready.connect(self.process_scans)
+        self._scan_dispatcher.log_message.connect(self.session_log)
+        self._scan_dispatcher.job_done.connect(lambda done, result: done(result))
+        self._scan_dispatcher.job_failed.connect(
+            lambda message: self.session_log("ERROR: Database error: {}".format(message))
+        )
+        self.db_worker = DBWorker(on_error=self._scan_dispatcher.job_failed.emit)
+        self.db_worker.start()
+        self.run_in_db_worker(self.db.prepare, self._scan_dispatcher.log_message.emit)
+        self.scan_dropped.connect(self.show_dropped_scan)
+        self.scan_pipeline = ScanPipeline(
+            dispatch=self._scan_dispatcher.scans_ready.emit,
+            on_drop=self.scan_dropped.emit,
+            duplicate_window=SCAN_DUPLICATE_WINDOW,
+        )
+        self.scan_pipeline.start()
+        for device in SCANNER_DEVICES:
+            self.session_log("Reading scans from serial scanner {}".format(device))
+            self.scan_pipeline.add_scanner(SerialScanner(device))
+
         self.select_scantype()  # Set up the default chosen scantype layout
+        self.archive_old_sessions()
 
     
     def select_scantype(self):
@@ -200,8 +260,28 @@ class MainWindow(QWidget):
             self._register_fluidx_group.show()
             self._search_progress.hide()
             self._session_log_group.show()
-            self.db.create_session("REGISTRATION")
+            self.run_in_db_worker(self.db.create_session, "REGISTRATION")
     
+    def archive_old_sessions(self):
+        """
+        Archive old sessions on the DB worker thread, logging progress as it
+        goes. Scans and list loads made meanwhile are queued behind it.
+        """
+        archiver = SessionArchiver(self.db, ARCHIVE_MAX_AGE_DAYS, ARCHIVE_PERIOD,
+            progress=self._scan_dispatcher.log_message.emit)
+        self.run_in_db_worker(archiver.archive, done=self.show_archive_report)
+
+    def show_archive_report(self, report):
+        if not report.sessions_archived:
+            return
+        self.session_log("Archived {} sessions older than {} days ({}) to {}".format(
+            report.sessions_archived, ARCHIVE_MAX_AGE_DAYS, ", ".join(report.periods), report.archive,
+        ))
+        self.session_log("Database size {:.1f} MB -> {:.1f} MB, query time {:.1f} ms -> {:.1f} ms".format(
+            report.size_before / 1e6, report.size_after / 1e6,
+            report.query_time_before * 1e3, report.query_time_after * 1e3,
+        ))
+
     def select_search_list(self):
         self.search_list, _ = QFileDialog.getOpenFileName(self, "Select search list")
         self._input_search_list_button.setText(self.search_list)
@@ -209,66 +289,171 @@ class MainWindow(QWidget):
     
     def load_search_list(self):
         if Path(self.search_list).is_file():
-            self.db.create_session(self.search_list)
-            self.sample_list = SampleList(
-                self.search_list,
-                self.db,
-                self._headers_checkbox.isChecked()
-            )
-            self.session_log("Started new session: {}".format(
-                self.db.session_id
-            ))
-            self.session_log("Loaded {} containing {} items.".format(
-                self.search_list,
-                self.sample_list.total_items,
-            ))
-            self._search_progress.setMaximum(self.sample_list.total_items)
+            self._pending_search_list = self.search_list
+            self.run_in_db_worker(self.read_search_list, self.search_list, self._headers_checkbox.isChecked(),
+                done=partial(self.show_search_list, self.search_list))
         else:
             self.session_log("Cannot load file '{}'.".format(
                 self.search_list
             ))
+
+    def read_search_list(self, search_list, header):
+        """
+        Start a session for search_list and store its items. Runs on the DB
+        worker thread; returns the session id and the SampleList, or None
+        if the list could not be read.
+        """
+        try:
+            self.db.create_session(search_list)
+            return self.db.session_id, SampleList(search_list, self.db, header)
+        except Exception:
+            logging.exception("Could not load search list %s", search_list)
+            return None
+
+    def show_search_list(self, search_list, loaded):
+        if self._pending_search_list == search_list:
+            self._pending_search_list = None
+        if not loaded:
+            self.session_log("ERROR: Could not load search list '{}'.".format(search_list))
+            return
+        session_id, sample_list = loaded
+        self.sample_list = sample_list
+        self._search_completed = False
+        self.session_log("Started new session: {}".format(
+            session_id
+        ))
+        self.session_log("Loaded {} containing {} items.".format(
+            sample_list.filename,
+            sample_list.total_items,
+        ))
+        self._search_progress.setMaximum(sample_list.total_items)
     
     def scan_button_action(self):
         scanned_item = self._scanfield.text()
+        self._scanfield.setText("")
         if not scanned_item:
             return False
-        item = self.search_scanned_item(scanned_item)
-        if item.id:
-            self.session_log("Found item {} in column {}".format(
-                item.item, item.column,
-            ))
-        else:
-            self.session_log("Could not find item {} in lists.".format(
-                item.item
-            ))
-        self._scanfield.setText("")
-    
-    def search_scanned_item(self, scanned_item):
-        item = self.db.find_item(scanned_item)
-        self.db.store_scanned_item(item)
-
-        # Update progressbar
-        scanned_items = self.db.get_items_scanned_in_session(self.db.session_id)
-        distinct_scanned_items = set((item[1:] for item in scanned_items))
-        self._search_progress.setValue(len(distinct_scanned_items))
-        if self._search_progress.value == self._search_progress.maximum:
+        return self.scan_pipeline.submit(scanned_item, context=self.scan_context())
+
+    def register_scanned_item(self):
+        item = self._register_scanfield.text()
+        self._register_scanfield.setText("")
+        if not item:
+            return False
+        return self.scan_pipeline.submit(item, context=self.scan_context())
+
+    def scan_context(self):
+        """
+        Scan type, sample type and box currently selected in the GUI.
+        """
+        return ScanContext(
+            self.scantype_combo.currentText(),
+            self._sample_type.currentText(),
+            self._register_box.text(),
+        )
+
+    def run_in_db_worker(self, job, *args, done=None):
+        """
+        Run job(*args) on the DB worker thread and hand its result to done
+        on the GUI thread.
+        """
+        if done is None:
+            self.db_worker.submit(job, *args)
+            return
+        self.db_worker.submit(job, *args, done=partial(self._scan_dispatcher.job_done.emit, done))
+
+    def after_pending_scans(self, job, *args, done=None):
+        """
+        Like run_in_db_worker, but queue job only once every scan made so
+        far has left the scan pipeline and been queued on the DB worker.
+        """
+        # The flush callback reaches the GUI thread after the scans it flushed
+        queue_job = lambda _: self.run_in_db_worker(job, *args, done=done)
+        self.scan_pipeline.flush(partial(self._scan_dispatcher.job_done.emit, queue_job, None))
+
+    def process_scans(self, scans):
+        """
+        Handle a batch of ScanEvents from the scan pipeline. Keyboard scans
+        carry the ScanContext they were made in; serial scanner scans use
+        the current one.
+        """
+        current_context = self.scan_context()
+        for context, group in groupby(scans, key=lambda scan: scan.context or current_context):
+            group = list(group)
+            barcodes = [scan.barcode for scan in group]
+            if context.scantype == "Register: Create sample registration list(s)":
+                self.run_in_db_worker(self.register_scanned_items, barcodes, context.sample_type, context.box,
+                    done=self.show_registered_items)
+                continue
+            scanned_datetimes = [
+                datetime.fromtimestamp(scan.timestamp).strftime(DATETIME_FMT) for scan in group
+            ]
+            self.run_in_db_worker(self.search_scanned_items, barcodes, scanned_datetimes,
+                done=partial(self.show_found_items, group))
+
+    def show_dropped_scan(self, scan):
+        if scan.barcode:
+            self.session_log("Ignored repeated read of item {}".format(scan.barcode))
+
+    def search_scanned_items(self, scanned_items, scanned_datetimes=None):
+        """
+        Look up and store scanned items. Runs on the DB worker thread;
+        returns the items and the updated session summary.
+        """
+        items = [self.db.find_item(scanned_item) for scanned_item in scanned_items]
+        self.db.store_scanned_items(items, scanned_datetimes)
+        return items, self.db.get_session_summary(self.db.session_id)
+
+    def show_found_items(self, scans, results):
+        items, summary = results
+        for item in items:
+            if item.id:
+                self.session_log("Found item {} in column {}".format(
+                    item.item, item.column,
+                ))
+            else:
+                self.session_log("Could not find item {} in lists.".format(
+                    item.item
+                ))
+        self.update_search_progress(summary)
+        self.scans_searched.emit(list(zip(scans, items)))
+
+    def update_search_progress(self, summary):
+        if summary:
+            self._search_progress.setValue(summary.found_items)
+        if not self.sample_list or self._search_completed:
+            return
+        if self._search_progress.value() == self._search_progress.maximum():
+            # Only on the batch that completes the list
+            self._search_completed = True
             self.session_log("COMPLETED: All {} items ".format(
                 self.sample_list.total_items
                 ) + "in file {} have been scanned.".format(
                 self.sample_list.filename
                 )
             )
-        return item
 
-    def register_scanned_item(self):
-        item = self._register_scanfield.text()
-        sample_type = self._sample_type.currentText()
-        box = self._register_box.text()
-        self.session_log("Registering item '{}' of type '{}' into box '{}'".format(
-            item, sample_type, box
-        ))
-        self.db.register_scanned_item(item, sample_type, box)
-        self._register_scanfield.setText("")
+    def register_scanned_items(self, items, sample_type, box):
+        """
+        Register scanned items one by one. Runs on the DB worker thread;
+        returns (item, sample_type, box, conflicts) for each item.
+        """
+        return [
+            (item, sample_type, box, self.db.register_scanned_item(item, sample_type, box))
+            for item in items
+        ]
+
+    def show_registered_items(self, registered):
+        for item, sample_type, box, conflicts in registered:
+            if conflicts:
+                for conflict in conflicts:
+                    self.session_log("ERROR: Not registering item '{}': {}".format(
+                        item, conflict.reason
+                    ))
+                continue
+            self.session_log("Registered item '{}' of type '{}' into box '{}'".format(
+                item, sample_type, box
+            ))
     
     def select_search_fluidx(self):
         self.fluidx, _ = QFileDialog.getOpenFileName(self, "Select FluidX CSV")
@@ -284,13 +469,20 @@ class MainWindow(QWidget):
         if not Path(self.fluidx).is_file():
             self.session_log("ERROR: Cannot load FluidX file")
             return
-        if not self.sample_list:
+        if not (self.sample_list or self._pending_search_list):
             self.session_log("ERROR: Load search list before loading FluidX file.")
             return
         self.session_log("Loading items from FluidX CSV: '{}'".format(self.fluidx))
-        scanned_items = self.sample_list.scan_fluidx_list(self.fluidx)
-        for position, barcode, _, rack_id in scanned_items:
-            item = self.search_scanned_item(barcode)
+        # Searched on the DB worker after a search list load still queued there
+        scanned_items = self.skip_empty_wells(SampleList.scan_fluidx_list(self.fluidx))
+        loaded = time.time()
+        scans = [ScanEvent(None, str(barcode), "fluidx", loaded, None) for _, barcode, _, _ in scanned_items]
+        self.run_in_db_worker(self.search_scanned_items, [scan.barcode for scan in scans],
+            done=partial(self.show_found_fluidx_items, scanned_items, scans))
+
+    def show_found_fluidx_items(self, scanned_items, scans, results):
+        items, summary = results
+        for (position, _, _, rack_id), item in zip(scanned_items, items):
             if item.id:
                 self.session_log("Found item {} from pos {} in rack {} of type {}.".format(
                     item.item, position, rack_id, item.column,
@@ -299,6 +491,8 @@ class MainWindow(QWidget):
                 self.session_log("Could not find item {} in lists!".format(
                     item.item
                 ))
+        self.update_search_progress(summary)
+        self.scans_searched.emit(list(zip(scans, items)))
 
     def load_register_fluidx(self):
         if not Path(self.fluidx).is_file():
@@ -316,9 +510,42 @@ class MainWindow(QWidget):
             self.session_log("FluidX shape is (rows, columns): {}".format(items.shape))
             return items.values.tolist()
 
-        fluidx_items = scan_fluidx_list(self.fluidx)
-        for position, barcode, _, rack_id in fluidx_items:
-            self.db.register_scanned_item(barcode, sample_type, rack_id, position)
+        fluidx_items = self.skip_empty_wells(scan_fluidx_list(self.fluidx))
+        if not fluidx_items:
+            self.session_log("ERROR: No tubes found in '{}', nothing to register.".format(self.fluidx))
+            return
+        registrations = [
+            (str(barcode), str(rack_id), str(position))
+            for position, barcode, _, rack_id in fluidx_items
+        ]
+        self.run_in_db_worker(self.db.register_scanned_items, registrations, sample_type,
+            done=partial(self.show_registered_fluidx_items, self.fluidx, registrations, sample_type))
+
+    def skip_empty_wells(self, fluidx_items):
+        """
+        Drop FluidX rows for wells without a tube (NaN, blank or placeholder
+        barcodes) before they are searched for or registered.
+        """
+        tubes = [row for row in fluidx_items if not is_empty_well(row[1])]
+        empty_wells = [row for row in fluidx_items if is_empty_well(row[1])]
+        if empty_wells:
+            self.session_log("Skipping {} empty wells: {}".format(
+                len(empty_wells),
+                ", ".join("{} in rack {}".format(position, rack_id) for position, _, _, rack_id in empty_wells),
+            ))
+        return tubes
+
+    def show_registered_fluidx_items(self, fluidx, registrations, sample_type, conflicts):
+        if conflicts:
+            for conflict in conflicts:
+                self.session_log("ERROR: Item '{}' in box '{}' at position '{}': {}".format(
+                    conflict.item, conflict.box, conflict.position, conflict.reason
+                ))
+            self.session_log("ERROR: Found {} conflicts, no items from '{}' were registered!".format(
+                len(conflicts), fluidx
+            ))
+            return
+        for barcode, rack_id, position in registrations:
             self.session_log("Registered item '{}' of type '{}' in box '{}' at position '{}'".format(
                 barcode, sample_type, rack_id, position
             ))
@@ -342,26 +569,37 @@ class MainWindow(QWidget):
                 input_stem = "Registered_samples"
             else:
                 input_stem = Path(self.search_list).stem
+            # Export once every scan made so far has been stored
+            self.after_pending_scans(self.export_report, outfolder, input_stem, selected_scantype,
+                done=self.show_saved_report)
+        else:
+            self.session_log("ERROR: Could not save report to {}".format(outfolder))
 
-            fn_datetime = self.db.session_datetime.replace(":", "-").replace(" ", "_")
-            session_basename = Path("{}_{}_{}".format(
-                fn_datetime, self.db.session_id, input_stem,
-            ))
-            session_report = outfolder / session_basename.with_suffix(".csv")
-
-            if selected_scantype == "Register: Create sample registration list(s)":
-                self.db.export_register_report(str(session_report))
-            else:
-                self.db.export_session_report(str(session_report))
-            self.session_log("Saved scanning session report to: {}".format(session_report))
+    def export_report(self, outfolder, input_stem, selected_scantype):
+        """
+        Export the current session's report. Runs on the DB worker thread;
+        returns the report path.
+        """
+        fn_datetime = self.db.session_datetime.replace(":", "-").replace(" ", "_")
+        session_basename = Path("{}_{}_{}".format(
+            fn_datetime, self.db.session_id, input_stem,
+        ))
+        session_report = outfolder / session_basename.with_suffix(".csv")
 
-            session_log = outfolder / session_basename.with_suffix(".log")
-            with open(str(session_log), 'w') as outf:
-                outf.write(self._session_log.toPlainText())
-                self.session_log("Wrote session log to {}".format(session_log))
-            self._session_saved = True
+        if selected_scantype == "Register: Create sample registration list(s)":
+            self.db.export_register_report(str(session_report))
         else:
-            self.session_log("ERROR: Could not save report to {}".format(outfolder))
+            self.db.export_session_report(str(session_report))
+        return session_report
+
+    def show_saved_report(self, session_report):
+        self.session_log("Saved scanning session report to: {}".format(session_report))
+
+        session_log = session_report.with_suffix(".log")
+        with open(str(session_log), 'w') as outf:
+            outf.write(self._session_log.toPlainText())
+            self.session_log("Wrote session log to {}".format(session_log))
+        self._session_saved = True
 
     def export_sample_list(self):
         self.export_old_session_window = ExportOldSessionWindow(self, dbfile=self.dbfile)
@@ -369,7 +607,8 @@ class MainWindow(QWidget):
     
     def exit(self):
         if self._session_saved:
-            exit()
+            # Store scans still on their way to the DB before quitting
+            self.after_pending_scans(lambda: None, done=self.shutdown)
         else:
             self.session_log("Exit button pressed,"
                 " but session log hasn't been saved."
@@ -377,14 +616,18 @@ class MainWindow(QWidget):
             )
             self._session_saved = True
 
+    def shutdown(self, _=None):
+        self.scan_pipeline.stop()
+        self.db_worker.stop()
+        exit()
 
     def _keypress_event_action(self, key):
         if key.key() == QtCore.Qt.Key_Tab:
             selected_scantype = self.scantype_combo.currentText()
             if selected_scantype == "Search: Search for samples in list(s)":
-                self.scan_button_action()
+                return self.scan_button_action()
             elif selected_scantype == "Register: Create sample registration list(s)":
-                self.register_scanned_item()
+                return self.register_scanned_item()
     
 
 class ExportOldSessionWindow(QWidget):
@@ -392,15 +635,31 @@ class ExportOldSessionWindow(QWidget):
         super(ExportOldSessionWindow, self).__init__()
         self.setWindowTitle("Export old scanning session")
         self.resize(700, 400)
-        self.db = ScannedSampleDB(dbfile=dbfile)
+        self.db = ScannedSampleDB(dbfile=dbfile, readonly=True)
         self._parent = parent
 
         self.session_list = QTableView()
         self.session_list.setShowGrid(False)
         self.session_list.setSelectionBehavior(1)  # Select only rows
         self.session_list.setSortingEnabled(True)
-        header = ["Datetime", "List filename", "Session ID"]
-        self.session_list.setModel(SessionTableModel(header=header, table_data=self.db.get_sessions_list()))
+        header = [
+            "Datetime", "List filename", "Session ID",
+            "Items", "Found", "Missing", "Completed (%)", "Scans", "Registered",
+        ]
+        def completed(summary):
+            if summary.total_items is None:  # Summaries not built yet
+                return None
+            return round(100 * summary.found_items / summary.total_items, 1) if summary.total_items else 0.0
+
+        table_data = [
+            [
+                summary.datetime, summary.filename, summary.session,
+                summary.total_items, summary.found_items, summary.missing_items,
+                completed(summary), summary.scans, summary.registered_items,
+            ]
+            for summary in self.db.get_session_summaries()
+        ]
+        self.session_list.setModel(SessionTableModel(header=header, table_data=table_data))
         self.session_list.resizeColumnsToContents()
         self.session_list.resizeRowsToContents()
 
@@ -413,6 +672,8 @@ class ExportOldSessionWindow(QWidget):
         layout.addWidget(self.session_list, 0, 0, 1, 2)
         layout.addWidget(self.export_button, 1, 0, 1, 1)
         layout.addWidget(self.close_button, 1, 1, 1, 1)
+        if not self.db.has_summaries():
+            layout.addWidget(QLabel("Session counts are still being built and will show when this window is reopened."), 2, 0, 1, 2)
         self.setLayout(layout)
 
     @staticmethod
@@ -422,7 +683,7 @@ class ExportOldSessionWindow(QWidget):
         current_group = []
         for idx, thing in enumerate(iterable, start=1):
             current_group.append(thing)
-            if idx % 3 == 0:
+            if idx % n == 0:
                 grouped.append(current_group)
                 current_group = []
         return grouped
@@ -430,7 +691,8 @@ class ExportOldSessionWindow(QWidget):
     def export_session(self):
         outfolder = QFileDialog.getExistingDirectory(self, "Select directory to export session report to")
         if Path(outfolder).is_dir():
-            for selected_row in self.grouper(self.session_list.selectedIndexes(), 3):
+            columns = self.session_list.model().columnCount(None)
+            for selected_row in self.grouper(self.session_list.selectedIndexes(), columns):
                 selected_data = [
                     self.session_list.model().data(selected_row[0], QtCore.Qt.DisplayRole),
                     self.session_list.model().data(selected_row[1], QtCore.Qt.DisplayRole),
@@ -459,6 +721,17 @@ class ExportOldSessionWindow(QWidget):
         self.hide()
 
 
+class ScanDispatcher(QtCore.QObject):
+    """
+    Carries batches of scans from the scan pipeline thread, and results of
+    database jobs from the DB worker thread, to the GUI thread.
+    """
+    scans_ready = QtCore.pyqtSignal(object)
+    job_done = QtCore.pyqtSignal(object, object)  # done callback, job result
+    job_failed = QtCore.pyqtSignal(str)
+    log_message = QtCore.pyqtSignal(str)
+
+
 class SessionTableModel(QtCore.QAbstractTableModel):
     def __init__(self, header, table_data):
         super(SessionTableModel, self).__init__()
@@ -483,7 +756,8 @@ class SessionTableModel(QtCore.QAbstractTableModel):
         return None
     
     def sort(self, ncol, order):
-        self.table_data = sorted(self.table_data, key=lambda row: row[ncol])
+        # Counts are None while session summaries are being built
+        self.table_data = sorted(self.table_data, key=lambda row: (row[ncol] is None, row[ncol]))
         if order == QtCore.Qt.DescendingOrder:
             self.table_data.reverse()
         self.layoutChanged.emit()
@@ -1,7 +1,7 @@
 """Scanned sample DB (sqlite3) and Sample List classes."""
 __author__ = "Fredrik Boulund"
 __date__ = "2018"
-__version__ = "1.2.0"
+__version__ = "1.3.0"
 
 from pathlib import Path
 from uuid import uuid1
@@ -9,29 +9,197 @@ from datetime import datetime
 from collections import namedtuple
 import logging
 import sqlite3
+import threading
 import csv
 
 import pandas as pd
 
+from db_access import ConnectionManager, readonly_uri
+
 Item = namedtuple("Item", ["id", "item", "column"])
+Conflict = namedtuple("Conflict", ["item", "box", "position", "reason"])
+SessionSummary = namedtuple("SessionSummary", [
+    "datetime", "filename", "session", "total_items", "found_items", "missing_items",
+    "scans", "duplicate_scans", "unknown_scans", "registered_items", "first_scan", "last_scan",
+])
+ColumnSummary = namedtuple("ColumnSummary", ["column", "total_items", "found_items", "missing_items"])
 DATETIME_FMT = "%Y-%m-%d %H:%M:%S"
+ARCHIVE_NAME = "{stem}_archive.sqlite3"
+# Barcodes (lowercased) that FluidX rack readers report for wells without a tube
+EMPTY_WELL_BARCODES = {"", "nan", "none", "empty", "no tube", "notube", "no read", "noread"}
+
+# Indexes used by per-session lookups and archival, created on every open
+# so that databases created by older versions also get them.
+DB_INDEXES = """
+    CREATE INDEX IF NOT EXISTS {schema}.session_datetime ON session(datetime);
+    CREATE INDEX IF NOT EXISTS {schema}.item_session_item ON item(session, item);
+    CREATE INDEX IF NOT EXISTS {schema}.scanned_item_session_id ON scanned_item(session, id);
+    CREATE INDEX IF NOT EXISTS {schema}.registered_item_session ON registered_item(session);
+    CREATE INDEX IF NOT EXISTS {schema}.registered_item_item ON registered_item(item);
+    CREATE INDEX IF NOT EXISTS {schema}.registered_item_box_position ON registered_item(box, position);
+"""
+
+# Per-session and per-column counts kept up to date by the write methods of
+# ScannedSampleDB, so that progress, session lists and report headers never
+# have to aggregate the raw item/scanned_item rows. Session datetime and
+# filename are copied in so the session browser needs no join. found_items counts
+# distinct list items scanned, duplicate_scans repeated scans of an already
+# found item and unknown_scans scans of items not in the list.
+SUMMARY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {schema}.session_summary (
+        session TEXT PRIMARY KEY,
+        datetime TEXT,
+        filename TEXT,
+        total_items INTEGER NOT NULL DEFAULT 0,
+        found_items INTEGER NOT NULL DEFAULT 0,
+        scans INTEGER NOT NULL DEFAULT 0,
+        duplicate_scans INTEGER NOT NULL DEFAULT 0,
+        unknown_scans INTEGER NOT NULL DEFAULT 0,
+        registered_items INTEGER NOT NULL DEFAULT 0,
+        first_scan TEXT,
+        last_scan TEXT
+    );
+    CREATE TABLE IF NOT EXISTS {schema}.column_summary (
+        session TEXT,
+        column TEXT,
+        total_items INTEGER NOT NULL DEFAULT 0,
+        found_items INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (session, column)
+    );
+    CREATE INDEX IF NOT EXISTS {schema}.session_summary_datetime ON session_summary(datetime);
+"""
+
+# Fills the summary tables from the raw rows, for databases created
+# before the summary tables existed.
+SUMMARY_BACKFILL = """
+    INSERT INTO {schema}.session_summary
+    SELECT
+        s.id,
+        s.datetime,
+        s.filename,
+        COALESCE(i.total_items, 0),
+        COALESCE(si.found_items, 0),
+        COALESCE(si.scans, 0),
+        COALESCE(si.found_scans - si.found_items, 0),
+        COALESCE(si.scans - si.found_scans, 0),
+        COALESCE(r.registered_items, 0),
+        si.first_scan,
+        si.last_scan
+    FROM {schema}.session AS s
+    LEFT JOIN (
+        SELECT session, COUNT(*) AS total_items
+        FROM {schema}.item
+        GROUP BY session
+    ) AS i ON i.session = s.id
+    LEFT JOIN (
+        SELECT
+            session,
+            COUNT(*) AS scans,
+            COUNT(DISTINCT CASE WHEN id != '' THEN id END) AS found_items,
+            COUNT(CASE WHEN id != '' THEN id END) AS found_scans,
+            MIN(scanned_datetime) AS first_scan,
+            MAX(scanned_datetime) AS last_scan
+        FROM {schema}.scanned_item
+        GROUP BY session
+    ) AS si ON si.session = s.id
+    LEFT JOIN (
+        SELECT session, COUNT(*) AS registered_items
+        FROM {schema}.registered_item
+        GROUP BY session
+    ) AS r ON r.session = s.id;
+    INSERT INTO {schema}.column_summary
+    SELECT i.session, i.column, COUNT(*), COUNT(DISTINCT si.id)
+    FROM {schema}.item AS i
+    LEFT JOIN (
+        SELECT DISTINCT session, id
+        FROM {schema}.scanned_item
+    ) AS si ON si.session = i.session AND si.id = i.id
+    GROUP BY i.session, i.column;
+"""
+
+# The archive database mirrors the live schema, except that item.id is not
+# a primary key: ids are only unique within a session once rows have been
+# moved out of the live DB and SQLite is free to reuse them. Sessions from
+# all periods share the one archive, partitioned by session.period.
+ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {schema}.session (
+        id TEXT PRIMARY KEY,
+        filename TEXT,
+        datetime TEXT,
+        period TEXT
+    );
+    CREATE INDEX IF NOT EXISTS {schema}.session_period ON session(period);
+    CREATE TABLE IF NOT EXISTS {schema}.item (
+        id INTEGER,
+        session TEXT,
+        column TEXT,
+        item TEXT
+    );
+    CREATE TABLE IF NOT EXISTS {schema}.scanned_item (
+        id INTEGER,
+        session TEXT,
+        item TEXT,
+        scanned_datetime TEXT
+    );
+    CREATE TABLE IF NOT EXISTS {schema}.registered_item (
+        session TEXT,
+        item TEXT,
+        sample_type TEXT,
+        box TEXT,
+        position TEXT,
+        scanned_datetime TEXT
+    );
+""" + DB_INDEXES
+
+def is_empty_well(barcode):
+    """
+    True if barcode is missing (NaN), blank or a reader placeholder such
+    as 'NO TUBE', i.e. the well holds no tube that could be registered.
+    """
+    return pd.isnull(barcode) or str(barcode).strip().lower() in EMPTY_WELL_BARCODES
+
 
 class ScannedSampleDB():
     """
     Small on-disk SQLite3 database persisting records of all items
     observed in input lists and all items scanned in a session.
+
+    Each thread using the object gets its own connection. A readonly
+    instance never writes and is meant for browsing and exporting old
+    sessions while another instance keeps scanning.
+
+    With prepare=False, a writable instance on an existing DB leaves
+    creating indexes and summary tables to a later call to prepare(),
+    which can run on another thread; it must finish before any writes.
     """
 
-    def __init__(self, dbfile):
-        if not Path(dbfile).is_file():
-            self.initiate_new_db(dbfile)
-        else:
-            self.db = sqlite3.connect(dbfile)
+    def __init__(self, dbfile, readonly=False, prepare=True):
+        self.dbfile = Path(dbfile)
+        self.readonly = readonly
+        self.connections = ConnectionManager(self.dbfile, readonly, on_connect=self._on_connect)
+        self._local = threading.local()
+        if not readonly:
+            if not self.dbfile.is_file():
+                self.initiate_new_db()
+                prepare = True  # Instant on an empty DB
+            if prepare:
+                self.prepare()
         self.session_id = ""
         self.session_datetime = ""
+        self.archive = self.dbfile.with_name(ARCHIVE_NAME.format(stem=self.dbfile.stem))
+        self.box_occupancy = {}
+
+    @property
+    def db(self):
+        """
+        SQLite3 connection for the calling thread.
+        """
+        return self.connections.connection()
+
+    def _on_connect(self, connection):
+        self._local.archive_attached = False
 
-    def initiate_new_db(self, dbfile):
-        self.db = sqlite3.connect(dbfile)
+    def initiate_new_db(self):
         self.db.executescript(
             """
             DROP TABLE IF EXISTS session;
@@ -70,6 +238,114 @@ class ScannedSampleDB():
         )
         self.db.commit()
 
+    def attach_archive(self):
+        """
+        Attach (creating if necessary) the archive database to the calling
+        thread's connection. Returns the schema name it is attached as.
+        """
+        connection = self.db
+        if self._local.archive_attached:
+            return "archive"
+        connection.commit()
+        try:
+            connection.execute(
+                "ATTACH DATABASE ? AS archive",
+                [readonly_uri(self.archive) if self.readonly else str(self.archive)]
+            )
+        except sqlite3.OperationalError as e:
+            logging.error("Could not attach archive %s: %s", self.archive, e)
+            raise
+        self._local.archive_attached = True
+        if not self.readonly:
+            connection.executescript(ARCHIVE_SCHEMA.format(schema="archive"))
+            self.ensure_summaries("archive")
+        logging.debug("Attached archive %s", self.archive)
+        return "archive"
+
+    def prepare(self, progress=None):
+        """
+        Create missing indexes and summary tables in the live DB. On a large
+        DB from an older version this takes a while, so the GUI runs it on
+        its DB worker thread; progress is called with a message if the
+        summaries have to be built.
+        """
+        self.db.executescript(DB_INDEXES.format(schema="main"))
+        self.ensure_summaries("main", progress)
+
+    def has_summaries(self, schema="main"):
+        """
+        True once the summary tables exist in schema. Readers fall back to
+        bare session rows until then.
+        """
+        return bool(self.db.execute(
+            "SELECT 1 FROM {}.sqlite_master WHERE type = 'table' AND name = 'session_summary'".format(schema)
+        ).fetchone())
+
+    def ensure_summaries(self, schema, progress=None):
+        """
+        Create the summary tables in schema, filling them from the raw rows
+        if they did not exist before. Both happen in one transaction, so
+        readers never see half-filled summaries.
+        """
+        if self.has_summaries(schema):
+            return
+        logging.info("Building session summaries in %s", schema)
+        if progress:
+            progress("Building session summaries, this is only done once")
+        self.db.executescript(
+            "BEGIN;" + SUMMARY_SCHEMA.format(schema=schema) + SUMMARY_BACKFILL.format(schema=schema) + "COMMIT;"
+        )
+
+    def schemas(self):
+        """
+        Live DB followed by the archive, if there is one, attached to the
+        calling thread's connection as needed.
+        """
+        if not getattr(self._local, "archive_attached", False) and not self.archive.is_file():
+            return ["main"]
+        return ["main", self.attach_archive()]
+
+    def session_schema(self, session):
+        """
+        Find the schema (live DB or archive) that holds session.
+        """
+        for schema in self.schemas():
+            found = self.db.execute(
+                "SELECT 1 FROM {}.session WHERE id = ?".format(schema),
+                [session]
+            ).fetchone()
+            if found:
+                return schema
+        return "main"
+
+    def database_size(self):
+        """
+        Size in bytes of the live DB file, including its write-ahead log.
+        """
+        wal = Path(str(self.dbfile) + "-wal")
+        return self.dbfile.stat().st_size + (wal.stat().st_size if wal.is_file() else 0)
+
+    def compact(self):
+        """
+        Return free pages in the live DB to the filesystem.
+
+        Databases created before incremental vacuum was enabled are
+        converted with a one-time full VACUUM.
+        """
+        self.db.commit()
+        auto_vacuum = self.db.execute("PRAGMA main.auto_vacuum").fetchone()[0]
+        if auto_vacuum != 2:  # 2 == INCREMENTAL
+            logging.info("Converting %s to incremental vacuum", self.dbfile)
+            self.db.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+            self.db.execute("VACUUM")
+            self.db.commit()
+        else:
+            # executescript steps the pragma to completion, execute() would
+            # only free a single page
+            self.db.executescript("PRAGMA main.incremental_vacuum;")
+        # Freed pages only leave the file once the WAL is checkpointed
+        self.db.execute("PRAGMA main.wal_checkpoint(TRUNCATE)").fetchall()
+
     def create_session(self, filename):
         """
         Create and store a session.
@@ -86,6 +362,10 @@ class ScannedSampleDB():
             """,
             session_data
         )
+        self.db.execute(
+            "INSERT INTO session_summary (session, filename, datetime) VALUES (?, ?, ?)",
+            session_data
+        )
         self.db.commit()
 
     def store_search_items(self, itemlists):
@@ -109,7 +389,30 @@ class ScannedSampleDB():
                 """,
                 items_to_insert
             )
+            self.db.execute(
+                """
+                INSERT OR IGNORE INTO column_summary (session, column)
+                VALUES (?, ?)
+                """,
+                [self.session_id, column]
+            )
+            self.db.execute(
+                """
+                UPDATE column_summary
+                SET total_items = total_items + ?
+                WHERE session = ? AND column = ?
+                """,
+                [len(items_to_insert), self.session_id, column]
+            )
             total_items += len(items_to_insert)
+        self.db.execute(
+            """
+            UPDATE session_summary
+            SET total_items = total_items + ?
+            WHERE session = ?
+            """,
+            [total_items, self.session_id]
+        )
         self.db.commit()
         return total_items
     
@@ -137,71 +440,331 @@ class ScannedSampleDB():
         return item
 
     def store_scanned_item(self, item):
-        self.db.execute(
+        self.store_scanned_items([item])
+
+    def store_scanned_items(self, items, scanned_datetimes=None):
+        """
+        Store a batch of scanned items in a single transaction.
+        """
+        if not items:
+            return
+        if scanned_datetimes is None:
+            scanned_datetimes = [datetime.now().strftime(DATETIME_FMT)] * len(items)
+        found_ids = set()
+        found_columns = {}
+        duplicate_scans = 0
+        unknown_scans = 0
+        for item in items:
+            if not item.id:
+                unknown_scans += 1
+            elif item.id in found_ids or self.db.execute(
+                    "SELECT 1 FROM scanned_item WHERE session = ? AND id = ? LIMIT 1",
+                    [self.session_id, item.id]
+                    ).fetchone():
+                duplicate_scans += 1
+            else:
+                found_ids.add(item.id)
+                found_columns[item.column] = found_columns.get(item.column, 0) + 1
+        self.db.executemany(
             """
             INSERT INTO scanned_item
             VALUES (?, ?, ?, ?)
             """,
-            (item.id, self.session_id, item.item, datetime.now().strftime(DATETIME_FMT))
+            [(item.id, self.session_id, item.item, scanned_datetime)
+                for item, scanned_datetime in zip(items, scanned_datetimes)]
+        )
+        self.db.execute(
+            """
+            UPDATE session_summary
+            SET found_items = found_items + ?,
+                scans = scans + ?,
+                duplicate_scans = duplicate_scans + ?,
+                unknown_scans = unknown_scans + ?,
+                first_scan = COALESCE(first_scan, ?),
+                last_scan = ?
+            WHERE session = ?
+            """,
+            [len(found_ids), len(items), duplicate_scans, unknown_scans,
+                min(scanned_datetimes), max(scanned_datetimes), self.session_id]
+        )
+        self.db.executemany(
+            """
+            UPDATE column_summary
+            SET found_items = found_items + ?
+            WHERE session = ? AND column = ?
+            """,
+            [(found, self.session_id, column) for column, found in found_columns.items()]
         )
         self.db.commit()
     
     def register_scanned_item(self, item, sample_type, box, position=""):
-        self.db.execute(
+        """
+        Register item unless it conflicts with an earlier registration.
+        Returns the list of conflicts, empty if the item was registered.
+        """
+        return self.register_scanned_items([(item, box, position)], sample_type)
+
+    def register_scanned_items(self, registrations, sample_type):
+        """
+        Validate (item, box, position) registrations in one bulk pass and
+        register all of them in a single transaction if there are no
+        conflicts. Returns the list of conflicts; on any conflict nothing
+        is registered.
+        """
+        conflicts = self.check_registrations(registrations)
+        if conflicts:
+            return conflicts
+        scanned_datetime = datetime.now().strftime(DATETIME_FMT)
+        self.db.executemany(
             """
             INSERT INTO registered_item
             VALUES (?, ?, ?, ?, ?, ?)
             """,
-            (self.session_id, item, sample_type, box, position, datetime.now().strftime(DATETIME_FMT))
+            [(self.session_id, item, sample_type, box, position, scanned_datetime)
+                for item, box, position in registrations]
+        )
+        self.db.execute(
+            """
+            UPDATE session_summary
+            SET registered_items = registered_items + ?
+            WHERE session = ?
+            """,
+            [len(registrations), self.session_id]
         )
         self.db.commit()
+        for item, box, position in registrations:
+            if position:
+                self.box_occupancy[box][position] = item
+        return []
+
+    def check_registrations(self, registrations):
+        """
+        Find conflicts for (item, box, position) registrations: empty well
+        placeholders, items that are already registered in this or any
+        other session (archived ones included), and box positions that are
+        already occupied, either in the DB or earlier in the same batch.
+        """
+        conflicts = []
+        registered = self.find_registered_items([item for item, _, _ in registrations])
+        batch_items = set()
+        for item, box, position in registrations:
+            if is_empty_well(item):
+                conflicts.append(Conflict(item, box, position, "not a tube barcode"))
+                continue
+            if item in batch_items:
+                conflicts.append(Conflict(item, box, position, "scanned twice"))
+            batch_items.add(item)
+            if item in registered:
+                session, registered_box, registered_position = registered[item]
+                where = "this session" if session == self.session_id else "session " + session
+                conflicts.append(Conflict(item, box, position, "already registered in {} (box '{}' position '{}')".format(
+                    where, registered_box, registered_position
+                )))
+            if not position:
+                continue
+            occupancy = self.get_box_occupancy(box)
+            if position in occupancy:
+                conflicts.append(Conflict(item, box, position, "position occupied by item '{}'".format(
+                    occupancy[position]
+                )))
+        # Positions taken by earlier rows of the same batch
+        batch_positions = {}
+        for item, box, position in registrations:
+            if not position:
+                continue
+            previous = batch_positions.setdefault((box, position), item)
+            if previous != item:
+                conflicts.append(Conflict(item, box, position, "position also assigned to item '{}'".format(
+                    previous
+                )))
+        return conflicts
+
+    def find_registered_items(self, items):
+        """
+        Look up existing registrations of items across all sessions.
+        Returns a dict mapping item to (session, box, position).
+        """
+        items = [item for item in items if not is_empty_well(item)]
+        registered = {}
+        # Chunked to stay below SQLite's limit on bound parameters
+        for start in range(0, len(items), 500):
+            chunk = items[start:start + 500]
+            for schema in self.schemas():
+                result = self.db.execute(
+                    """
+                    SELECT item, session, box, position
+                    FROM {}.registered_item
+                    WHERE item IN ({})
+                    """.format(schema, ", ".join("?" * len(chunk))),
+                    chunk
+                )
+                for item, session, box, position in result:
+                    registered.setdefault(item, (session, box, position))
+        return registered
+
+    def get_box_occupancy(self, box):
+        """
+        In-memory map of position -> item for all registered positions in
+        box, loaded from the DB the first time box is seen and kept up to
+        date by register_scanned_items.
+        """
+        if box not in self.box_occupancy:
+            occupancy = {}
+            for schema in self.schemas():
+                occupancy.update(
+                    (position, item) for position, item in self.db.execute(
+                        """
+                        SELECT position, item
+                        FROM {}.registered_item
+                        WHERE box = ? AND position != ''
+                        """.format(schema),
+                        [box]
+                    )
+                    # Empty wells registered by earlier versions hold no tube
+                    if not is_empty_well(item)
+                )
+            self.box_occupancy[box] = occupancy
+        return self.box_occupancy[box]
     
     def get_items_scanned_in_session(self, session):
+        schema = self.session_schema(session)
         result = self.db.execute(
             """
             SELECT si.scanned_datetime, si.item, i.column
-            FROM scanned_item AS si
-            JOIN item AS i
-            WHERE si.id = i.id AND si.session = ?
-            """,
+            FROM {schema}.scanned_item AS si
+            JOIN {schema}.item AS i
+            WHERE si.id = i.id AND si.session = i.session AND si.session = ?
+            """.format(schema=schema),
             [session]
         ).fetchall()
         return result
 
     def get_items_registered_in_session(self, session):
+        schema = self.session_schema(session)
         result = self.db.execute(
             """
             SELECT item, sample_type, box, position, scanned_datetime
-            FROM registered_item
+            FROM {schema}.registered_item
             WHERE session = ?
-            """,
+            """.format(schema=schema),
             [session]
         ).fetchall()
         return result
     
     def get_items_not_scanned_in_session(self, session):
+        schema = self.session_schema(session)
         result = self.db.execute(
             """
             SELECT DISTINCT i.item, i.column
-            FROM item AS i
-            WHERE i.item NOT IN (
+            FROM {schema}.item AS i
+            WHERE i.session = ? AND i.item NOT IN (
                 SELECT si.item 
-                FROM scanned_item AS si
+                FROM {schema}.scanned_item AS si
                 WHERE si.session = ?
             )
-            """,
-            [session]
+            """.format(schema=schema),
+            [session, session]
         ).fetchall()
         return result
     
     def get_sessions_list(self):
         result = self.db.execute(
+            " UNION ALL ".join(
+                "SELECT datetime, filename, id FROM {}.session".format(schema)
+                for schema in self.schemas()
+            )
+        ).fetchall()
+        return result
+
+    def get_session_summaries(self):
+        """
+        Summaries of all sessions, archived ones included, newest first.
+        Counts are None for sessions whose summaries are not built yet.
+        """
+        session_summary = """
+            SELECT
+                datetime, filename, session,
+                total_items, found_items, total_items - found_items,
+                scans, duplicate_scans, unknown_scans, registered_items,
+                first_scan, last_scan
+            FROM {schema}.session_summary
             """
-            SELECT datetime, filename, id
-            FROM session
+        session_only = """
+            SELECT
+                datetime, filename, id,
+                NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL
+            FROM {schema}.session
             """
+        result = self.db.execute(
+            " UNION ALL ".join(
+                (session_summary if self.has_summaries(schema) else session_only).format(schema=schema)
+                for schema in self.schemas()
+            ) + " ORDER BY datetime DESC"
         ).fetchall()
-        return result
+        return [SessionSummary(*row) for row in result]
+
+    def get_session_summary(self, session):
+        schema = self.session_schema(session)
+        if not self.has_summaries(schema):
+            return None
+        result = self.db.execute(
+            """
+            SELECT
+                datetime, filename, session,
+                total_items, found_items, total_items - found_items,
+                scans, duplicate_scans, unknown_scans, registered_items,
+                first_scan, last_scan
+            FROM {schema}.session_summary
+            WHERE session = ?
+            """.format(schema=schema),
+            [session]
+        ).fetchone()
+        if result:
+            return SessionSummary(*result)
+        return None
+
+    def get_column_summaries(self, session):
+        schema = self.session_schema(session)
+        if not self.has_summaries(schema):
+            return []
+        result = self.db.execute(
+            """
+            SELECT column, total_items, found_items, total_items - found_items
+            FROM {schema}.column_summary
+            WHERE session = ?
+            ORDER BY column
+            """.format(schema=schema),
+            [session]
+        ).fetchall()
+        return [ColumnSummary(*row) for row in result]
+
+    def write_summary_header(self, outfile, session_id):
+        """
+        Write session totals as '#' comment lines at the top of a report.
+        """
+        summary = self.get_session_summary(session_id)
+        if not summary:
+            return
+        outfile.write("# Session: {}\n".format(summary.session))
+        outfile.write("# List: {}\n".format(summary.filename))
+        outfile.write("# Started: {}\n".format(summary.datetime))
+        if summary.registered_items:
+            outfile.write("# Registered items: {}\n".format(summary.registered_items))
+            return
+        completed = 100 * summary.found_items / summary.total_items if summary.total_items else 0
+        outfile.write("# Items: {}; Found: {}; Missing: {}; Completed: {:.1f}%\n".format(
+            summary.total_items, summary.found_items, summary.missing_items, completed,
+        ))
+        outfile.write("# Scans: {}; Duplicate scans: {}; Not in list: {}\n".format(
+            summary.scans, summary.duplicate_scans, summary.unknown_scans,
+        ))
+        outfile.write("# First scan: {}; Last scan: {}\n".format(
+            summary.first_scan or "", summary.last_scan or "",
+        ))
+        for column in self.get_column_summaries(session_id):
+            outfile.write("# Column {}: Items: {}; Found: {}; Missing: {}\n".format(
+                column.column, column.total_items, column.found_items, column.missing_items,
+            ))
 
     def export_session_report(self, report_filename, session_id=None):
         if not session_id:
@@ -213,6 +776,7 @@ class ScannedSampleDB():
         scanned_items = self.get_items_scanned_in_session(session_id)
         not_scanned_items = self.get_items_not_scanned_in_session(session_id)
         with open(report_filename, 'w') as outfile:
+            self.write_summary_header(outfile, session_id)
             outfile.write("Datetime; Item; Column\n")
             for item in scanned_items:
                 outfile.write("{}; {}; {}\n".format(
@@ -231,6 +795,7 @@ class ScannedSampleDB():
         ))
         registered_items = self.get_items_registered_in_session(session_id)
         with open(report_filename, 'w') as outfile:
+            self.write_summary_header(outfile, session_id)
             outfile.write("Item;Sample_type;Box;Position;Datetime\n")
             for item in registered_items:
                 outfile.write("{};{};{};{};{}\n".format(
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3.5
+"""
+Replay recorded or synthetic barcode scans into the CTMR list scanner
+MainWindow, headless, and report latency, memory and DB growth.
+
+Run from the repository root, e.g. for one hour at 10 scans/s:
+
+    python src/main/python/scan_replay.py --rate 10 --duration 3600 --report v0.4.json
+
+and compare two runs with --compare old.json.
+"""
+__author__ = "Fredrik Boulund"
+__date__ = "2018"
+
+from datetime import datetime
+from pathlib import Path
+import argparse
+import tempfile
+import platform
+import logging
+import random
+import json
+import time
+import sys
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5 import QtCore
+from PyQt5.QtGui import QKeyEvent
+
+import main
+from sample_list import __version__ as sample_list_version
+
+PERCENTILES = [50, 90, 95, 99, 100]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--list", help="Search list to load, in any format the list scanner reads. "
+        "Synthetic scans are drawn from its items. Default: synthetic list of --items barcodes.")
+    parser.add_argument("--headers", action="store_true", help="The --list file has a header row.")
+    parser.add_argument("--items", type=int, default=5000, help="Size of synthetic search list [%(default)s].")
+    parser.add_argument("--scans", help="Recorded scans, one per line: '<seconds> <barcode>' or just '<barcode>'. "
+        "Default: synthetic scans drawn from the search list.")
+    parser.add_argument("--rate", type=float, default=10, help="Scans per second when not given by --scans [%(default)s].")
+    parser.add_argument("--miss-rate", type=float, default=0.05,
+        help="Fraction of synthetic scans not in the search list [%(default)s].")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run [%(default)s].")
+    parser.add_argument("--fluidx", help="FluidX CSV to load every --fluidx-every seconds. "
+        "Default: synthetic 96-tube rack from the search list.")
+    parser.add_argument("--fluidx-every", type=float, default=0, help="Seconds between FluidX loads, 0 disables [%(default)s].")
+    parser.add_argument("--sample-every", type=float, default=10, help="Seconds between measurements [%(default)s].")
+    parser.add_argument("--workdir", help="Directory for the scan DB and generated files. Default: new temp dir.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for synthetic data [%(default)s].")
+    parser.add_argument("--report", help="Write JSON report to this file.")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against.")
+    return parser.parse_args()
+
+
+def percentiles(values):
+    """
+    Nearest-rank percentiles of values, as a dict.
+    """
+    if not values:
+        return {"p{}".format(p): None for p in PERCENTILES}
+    values = sorted(values)
+    return {
+        "p{}".format(p): values[max(0, -(-p * len(values) // 100) - 1)]
+        for p in PERCENTILES
+    }
+
+
+def rss_bytes():
+    """
+    Current resident set size of this process, or peak RSS where the current
+    value is not available.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def write_synthetic_list(filename, n_items, rng):
+    barcodes = ["SYN{:08d}".format(rng.randrange(10**8)) for _ in range(n_items)]
+    with open(str(filename), "w") as outfile:
+        outfile.write("\n".join(barcodes) + "\n")
+    return barcodes
+
+
+def write_synthetic_fluidx(filename, barcodes, rng):
+    with open(str(filename), "w") as outfile:
+        for idx, barcode in enumerate(rng.sample(barcodes, min(96, len(barcodes)))):
+            position = "{}{}".format("ABCDEFGH"[idx // 12], idx % 12 + 1)
+            outfile.write("{},{},1d_barcode_id,SYNRACK\n".format(position, barcode))
+
+
+def read_scans(filename, rate):
+    """
+    Recorded scans as a list of (offset_seconds, barcode).
+    """
+    scans = []
+    with open(filename) as infile:
+        for line in infile:
+            fields = line.split()
+            if len(fields) >= 2:
+                scans.append((float(fields[0]), fields[1]))
+            elif fields:
+                scans.append((len(scans) / rate, fields[0]))
+    return scans
+
+
+def synthetic_scans(barcodes, rate, miss_rate, rng):
+    """
+    Endless stream of (offset_seconds, barcode) at rate scans per second.
+    """
+    count = 0
+    while True:
+        if rng.random() < miss_rate:
+            barcode = "MISS{:08d}".format(rng.randrange(10**8))
+        else:
+            barcode = rng.choice(barcodes)
+        yield count / rate, barcode
+        count += 1
+
+
+class ScanReplay():
+    """
+    Drives a MainWindow with a stream of scans from Qt timers and collects
+    measurements while the Qt event loop runs.
+    """
+
+    def __init__(self, app, window, scans, args):
+        self.app = app
+        self.window = window
+        self.scans = iter(scans)
+        self.args = args
+        self.next_scan = next(self.scans, None)
+        self.latencies = []
+        self.interval_latencies = []
+        self.fluidx_latencies = []
+        self.send_delays = []
+        # Scheduled perf_counter time of each scan in flight, by pipeline sequence
+        self.scheduled = {}
+        self.submitted = 0
+        self.logged = 0
+        self.dropped = 0
+        self.samples = []
+        self.start = None
+
+        # The window reports each scan once it has been logged or dropped
+        window.scans_searched.connect(self.scans_searched)
+        window.scan_dropped.connect(self.scan_dropped)
+
+        self.scan_timer = QtCore.QTimer()
+        self.scan_timer.timeout.connect(self.feed_scans)
+        self.sample_timer = QtCore.QTimer()
+        self.sample_timer.timeout.connect(self.sample)
+        self.fluidx_timer = QtCore.QTimer()
+        self.fluidx_timer.timeout.connect(self.load_fluidx)
+        self.finish_timer = QtCore.QTimer()
+        self.finish_timer.timeout.connect(self._finish)
+        self.finish_deadline = None
+
+    def run(self):
+        self.start = time.perf_counter()
+        self.sample()
+        self.scan_timer.start(5)
+        self.sample_timer.start(int(self.args.sample_every * 1000))
+        if self.args.fluidx_every:
+            self.fluidx_timer.start(int(self.args.fluidx_every * 1000))
+        QtCore.QTimer.singleShot(int(self.args.duration * 1000), self.finish)
+        self.app.exec_()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def feed_scans(self):
+        elapsed = self.elapsed()
+        while self.next_scan is not None and self.next_scan[0] <= elapsed:
+            offset, barcode = self.next_scan
+            self.scan(barcode, self.start + offset)
+            self.next_scan = next(self.scans, None)
+
+    def scan(self, barcode, scheduled):
+        """
+        Type barcode into the scan field and press Tab, as a keyboard
+        wedge scanner would, and record how late it was sent.
+        """
+        self.submitted += 1
+        self.window._scanfield.setText(barcode)
+        self.send_delays.append(time.perf_counter() - scheduled)
+        sequence = self.window.keyPressEvent(
+            QKeyEvent(QtCore.QEvent.KeyPress, QtCore.Qt.Key_Tab, QtCore.Qt.NoModifier)
+        )
+        self.scheduled[sequence] = scheduled
+
+    def scans_searched(self, results):
+        """
+        Latency of each logged scan, measured from when it was scheduled,
+        so time the scan spent waiting for a busy GUI thread counts too.
+        FluidX scans are measured from when the file was loaded.
+        """
+        now = time.perf_counter()
+        for scan, _ in results:
+            if scan.scanner == "fluidx":
+                self.fluidx_latencies.append(time.time() - scan.timestamp)
+                continue
+            latency = now - self.scheduled.pop(scan.sequence)
+            self.latencies.append(latency)
+            self.interval_latencies.append(latency)
+            self.logged += 1
+
+    def scan_dropped(self, scan):
+        self.scheduled.pop(scan.sequence, None)
+        self.dropped += 1
+
+    def load_fluidx(self):
+        self.window.load_search_fluidx()
+
+    def sample(self):
+        document = self.window._session_log.document()
+        sample = {
+            "elapsed": self.elapsed(),
+            "scans_submitted": self.submitted,
+            "scans_logged": self.logged,
+            "scans_dropped": self.dropped,
+            "rss_bytes": rss_bytes(),
+            "log_characters": document.characterCount(),
+            "log_blocks": document.blockCount(),
+            "db_bytes": self.window.db.database_size(),
+            "latency_ms": {
+                key: value * 1000 if value is not None else None
+                for key, value in percentiles(self.interval_latencies).items()
+            },
+        }
+        self.interval_latencies = []
+        self.samples.append(sample)
+        logging.info("%.0f s: %s scans, %.1f MB RSS, %.1f MB DB, p95 %s ms",
+            sample["elapsed"], sample["scans_submitted"],
+            sample["rss_bytes"] / 1e6, sample["db_bytes"] / 1e6,
+            sample["latency_ms"]["p95"],
+        )
+
+    def finish(self):
+        self.scan_timer.stop()
+        self.fluidx_timer.stop()
+        # Let scans still in the pipeline or the DB worker reach the log
+        self.finish_deadline = time.perf_counter() + 30
+        self.finish_timer.start(100)
+
+    def _finish(self):
+        if self.logged + self.dropped < self.submitted and time.perf_counter() < self.finish_deadline:
+            return
+        self.finish_timer.stop()
+        self.sample_timer.stop()
+        self.sample()
+        self.window.scan_pipeline.stop()
+        self.window.db_worker.stop()
+        self.app.quit()
+
+    def report(self):
+        first, last = self.samples[0], self.samples[-1]
+        return {
+            "created": datetime.now().isoformat(),
+            "versions": {
+                "main": main.__version__,
+                "sample_list": sample_list_version,
+                "python": platform.python_version(),
+                "qt": QtCore.QT_VERSION_STR,
+            },
+            "config": vars(self.args),
+            "scans_submitted": self.submitted,
+            "scans_logged": self.logged,
+            "scans_dropped": self.dropped,
+            "scans_unaccounted": self.submitted - self.logged - self.dropped,
+            "latency_ms": {key: value * 1000 if value is not None else None
+                for key, value in percentiles(self.latencies).items()},
+            "send_delay_ms": {key: value * 1000 if value is not None else None
+                for key, value in percentiles(self.send_delays).items()},
+            "fluidx_latency_ms": {key: value * 1000 if value is not None else None
+                for key, value in percentiles(self.fluidx_latencies).items()},
+            "rss_growth_bytes": last["rss_bytes"] - first["rss_bytes"],
+            "log_characters": last["log_characters"],
+            "db_growth_bytes": last["db_bytes"] - first["db_bytes"],
+            "samples": self.samples,
+        }
+
+
+def flatten(report, prefix=""):
+    """
+    Scalar metrics of a report as {"dotted.name": value}, for comparisons.
+    """
+    flat = {}
+    for key, value in report.items():
+        if key in ("config", "samples", "versions", "created"):
+            continue
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + "."))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def print_comparison(old, new):
+    print("{:<28} {:>14} {:>14} {:>9}".format(
+        "metric", "v" + old["versions"]["main"], "v" + new["versions"]["main"], "change"
+    ))
+    old_metrics, new_metrics = flatten(old), flatten(new)
+    for metric in sorted(set(old_metrics) | set(new_metrics)):
+        before, after = old_metrics.get(metric), new_metrics.get(metric)
+        change = ""
+        if before and after is not None:
+            change = "{:+.1f}%".format((after - before) / abs(before) * 100)
+        print("{:<28} {:>14} {:>14} {:>9}".format(
+            metric,
+            "" if before is None else "{:.4g}".format(before),
+            "" if after is None else "{:.4g}".format(after),
+            change,
+        ))
+
+
+def main_replay():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    rng = random.Random(args.seed)
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="scan_replay_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    logging.info("Working directory: %s", workdir)
+
+    if args.scans:
+        scans = read_scans(args.scans, args.rate)
+    barcodes = None
+    if args.list:
+        search_list = args.list
+    else:
+        search_list = str(workdir / "replay_list.txt")
+        if args.scans:
+            barcodes = sorted(set(barcode for _, barcode in scans))
+            with open(search_list, "w") as outfile:
+                outfile.write("\n".join(barcodes) + "\n")
+        else:
+            barcodes = write_synthetic_list(search_list, args.items, rng)
+
+    main.appctxt = main.AppContext()
+    window = main.MainWindow(dbfile=str(workdir / "CTMR_scanned_items.sqlite3"))
+    window.search_list = search_list
+    window._headers_checkbox.setChecked(args.headers)
+    window.load_search_list()
+    # The list is stored on the DB worker thread, queued behind archiving;
+    # wait until the worker is through both, whether or not they succeeded
+    idle = []
+    window.run_in_db_worker(lambda: None, done=idle.append)
+    while not idle:
+        main.appctxt.app.processEvents()
+        time.sleep(0.01)
+    if window.sample_list is None:
+        sys.exit("Could not load search list {}".format(search_list))
+    if barcodes is None:
+        # Items as the list scanner parsed them, whatever the list format
+        barcodes = sorted(set(
+            item for item, _ in window.db.get_items_not_scanned_in_session(window.db.session_id)
+        ))
+        logging.info("Loaded %s distinct items from %s", len(barcodes), search_list)
+    if not args.scans:
+        scans = synthetic_scans(barcodes, args.rate, args.miss_rate, rng)
+    if args.fluidx_every:
+        window.fluidx = args.fluidx or str(workdir / "replay_fluidx.csv")
+        if not args.fluidx:
+            write_synthetic_fluidx(window.fluidx, barcodes, rng)
+
+    replay = ScanReplay(main.appctxt.app, window, scans, args)
+    replay.run()
+    report = replay.report()
+    summary = {key: value for key, value in report.items() if key != "samples"}
+    print(json.dumps(summary, indent=2))
+    if args.report:
+        with open(args.report, "w") as outfile:
+            json.dump(report, outfile, indent=2)
+        logging.info("Wrote report to %s", args.report)
+    if args.compare:
+        with open(args.compare) as infile:
+            print_comparison(json.load(infile), report)
+
+
+if __name__ == "__main__":
+    main_replay()
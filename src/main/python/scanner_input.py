@@ -0,0 +1,219 @@
+"""Asynchronous barcode scanner input pipeline."""
+__author__ = "Fredrik Boulund"
+__date__ = "2018"
+
+from collections import namedtuple, OrderedDict
+import itertools
+import asyncio
+import logging
+import threading
+import time
+import os
+import re
+
+try:
+    import tty
+except ImportError:  # Windows
+    tty = None
+
+ScanEvent = namedtuple("ScanEvent", ["sequence", "barcode", "scanner", "timestamp", "context"])
+
+
+class ScanPipeline():
+    """
+    Collects scans from any number of scanners on an asyncio event loop
+    running in a background thread.
+
+    Scans are numbered and timestamped when they arrive, accidental
+    double-reads of the same barcode within duplicate_window seconds are
+    dropped, and the rest are handed to dispatch in batches (lists of
+    ScanEvent). Dropped scans are passed to on_drop, if given, so every
+    sequence number ends up in exactly one of the two. Both are called from
+    the pipeline thread, so GUI code should pass something thread-safe such
+    as a Qt signal's emit. Each scan carries the context given to submit
+    (None for serial scanners) through to dispatch.
+    """
+
+    def __init__(self, dispatch, on_drop=None, duplicate_window=1.0, batch_size=50, batch_interval=0.05):
+        self.dispatch = dispatch
+        self.on_drop = on_drop
+        self.duplicate_window = duplicate_window
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.suppressed = 0
+        self.loop = asyncio.new_event_loop()
+        self._queue = None
+        self._last_seen = OrderedDict()
+        self._sequence = itertools.count(1)
+        self._scanners = []
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="scanner-input", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self):
+        """
+        Dispatch the scans still queued, then stop the pipeline thread.
+        """
+        if not self._thread.is_alive():
+            return
+        self.flush(self.loop.stop)
+        self._thread.join()
+
+    def flush(self, callback):
+        """
+        Dispatch every scan submitted so far without waiting for the batch
+        interval, then call callback from the pipeline thread.
+        """
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, callback)
+
+    def submit(self, barcode, scanner="keyboard", context=None):
+        """
+        Queue a scan from another thread, e.g. the Qt keyboard handler.
+        context is any state the scan should be processed with, captured
+        at the time of the scan. Returns the scan's sequence number.
+        """
+        sequence = next(self._sequence)
+        self.loop.call_soon_threadsafe(self._on_scan, barcode, scanner, time.time(), context, sequence)
+        return sequence
+
+    def add_scanner(self, scanner):
+        """
+        Start reading scans from a SerialScanner.
+        """
+        self.loop.call_soon_threadsafe(self._add_scanner, scanner)
+
+    def _add_scanner(self, scanner):
+        try:
+            scanner.open(self.loop, self._on_scan)
+        except OSError as e:
+            logging.error("Could not open scanner %s: %s", scanner.name, e)
+            return
+        self._scanners.append(scanner)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self._queue = asyncio.Queue()
+        consumer = self.loop.create_task(self._consume())
+        self._started.set()
+        self.loop.run_forever()
+        consumer.cancel()
+        for scanner in self._scanners:
+            scanner.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+
+    def _on_scan(self, barcode, scanner, timestamp, context=None, sequence=None):
+        if sequence is None:
+            if not barcode.strip():  # Blank line between CR and LF
+                return
+            sequence = next(self._sequence)
+        scan = ScanEvent(sequence, barcode.strip(), scanner, timestamp, context)
+        if not scan.barcode:
+            self._drop(scan)
+            return
+        if self._is_double_read(scan.barcode, timestamp):
+            self.suppressed += 1
+            logging.debug("Suppressed double read of %s from %s", scan.barcode, scanner)
+            self._drop(scan)
+            return
+        self._queue.put_nowait(scan)
+
+    def _drop(self, scan):
+        if not self.on_drop:
+            return
+        try:
+            self.on_drop(scan)
+        except Exception:
+            logging.exception("Failed to report dropped scan %s", scan.sequence)
+
+    def _is_double_read(self, barcode, timestamp):
+        # Forget barcodes seen longer ago than the window, oldest first
+        while self._last_seen:
+            if timestamp - next(iter(self._last_seen.values())) < self.duplicate_window:
+                break
+            self._last_seen.popitem(last=False)
+        double_read = barcode in self._last_seen
+        self._last_seen.pop(barcode, None)
+        self._last_seen[barcode] = timestamp
+        return double_read
+
+    async def _consume(self):
+        # The queue holds ScanEvents and flush callbacks, in submission order
+        while True:
+            batch = []
+            flushed = []
+            queued = await self._queue.get()
+            if isinstance(queued, ScanEvent):
+                batch.append(queued)
+                # Give rapid-fire scans a moment to accumulate into one batch
+                await asyncio.sleep(self.batch_interval)
+            else:
+                flushed.append(queued)
+            while len(batch) < self.batch_size and not flushed and not self._queue.empty():
+                queued = self._queue.get_nowait()
+                if isinstance(queued, ScanEvent):
+                    batch.append(queued)
+                else:
+                    flushed.append(queued)
+            if batch:
+                try:
+                    self.dispatch(batch)
+                except Exception:
+                    logging.exception("Failed to dispatch %s scans", len(batch))
+            for callback in flushed:
+                try:
+                    callback()
+                except Exception:
+                    logging.exception("Failed to run flush callback")
+
+
+class SerialScanner():
+    """
+    Barcode scanner attached as a serial/tty device (or a pseudo-terminal)
+    that terminates each barcode with CR, LF or Tab. Only available on POSIX systems.
+    """
+
+    def __init__(self, device, name=None):
+        self.device = device
+        self.name = name or device
+        self.fd = None
+        self._loop = None
+        self._on_scan = None
+        self._buffer = b""
+
+    def open(self, loop, on_scan):
+        if tty is None:
+            raise OSError("Serial scanners are not supported on this platform")
+        self.fd = os.open(self.device, os.O_RDONLY | os.O_NOCTTY | os.O_NONBLOCK)
+        if os.isatty(self.fd):
+            tty.setraw(self.fd)
+        self._loop = loop
+        self._on_scan = on_scan
+        loop.add_reader(self.fd, self._read)
+        logging.info("Reading scans from %s", self.device)
+
+    def close(self):
+        if self.fd is None:
+            return
+        self._loop.remove_reader(self.fd)
+        os.close(self.fd)
+        self.fd = None
+
+    def _read(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:  # EIO once the other end of a pty is closed
+            logging.error("Lost scanner %s: %s", self.name, e)
+            data = b""
+        if not data:
+            self.close()
+            return
+        timestamp = time.time()
+        *lines, self._buffer = re.split(b"[\r\n\t]", self._buffer + data)
+        for line in lines:
+            self._on_scan(line.decode("utf-8", errors="replace"), self.name, timestamp)
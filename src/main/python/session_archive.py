@@ -0,0 +1,197 @@
+"""Archival of old scanning sessions into a separate SQLite3 database."""
+__author__ = "Fredrik Boulund"
+__date__ = "2018"
+
+from datetime import datetime, timedelta
+from collections import namedtuple
+import logging
+import time
+
+from sample_list import DATETIME_FMT
+
+ArchiveReport = namedtuple("ArchiveReport", [
+    "sessions_archived",
+    "periods",
+    "archive",
+    "size_before",
+    "size_after",
+    "query_time_before",
+    "query_time_after",
+])
+# Length of the session datetime prefix that names a period
+PERIOD_LENGTH = {
+    "year": len("YYYY"),
+    "month": len("YYYY-MM"),
+}
+# Sessions moved per pair of archive/live transactions, so progress can be
+# reported and the live DB is never write-locked for long
+ARCHIVE_BATCH_SIZE = 100
+# Tables moved per session, with the column that holds the session id
+ARCHIVED_TABLES = [
+    ("item", "session", "id, session, column, item"),
+    ("scanned_item", "session", "id, session, item, scanned_datetime"),
+    ("registered_item", "session", "session, item, sample_type, box, position, scanned_datetime"),
+    ("session_summary", "session", "session, datetime, filename, total_items, found_items, scans, "
+        "duplicate_scans, unknown_scans, registered_items, first_scan, last_scan"),
+    ("column_summary", "session", "session, column, total_items, found_items"),
+    ("session", "id", "id, filename, datetime"),
+]
+
+
+class SessionArchiver():
+    """
+    Moves sessions older than max_age_days out of the live ScannedSampleDB
+    into its archive database, then compacts the live DB.
+
+    Each archived session is tagged with its period (year or month), so
+    the archive stays a single attached database however many years of
+    sessions it holds. ScannedSampleDB attaches it to keep session lists,
+    exports and history lookups seeing archived sessions.
+
+    progress, if given, is called with a message for each step; archiving
+    a large DB takes a while and is meant to run off the GUI thread.
+    """
+
+    def __init__(self, db, max_age_days=365, period="year", progress=None):
+        if period not in PERIOD_LENGTH:
+            raise ValueError("Unknown archive period '{}', expected one of {}".format(
+                period, ", ".join(PERIOD_LENGTH)
+            ))
+        self.db = db
+        self.max_age_days = max_age_days
+        self.period = period
+        self.progress = progress
+
+    def report_progress(self, message):
+        logging.info(message)
+        if self.progress:
+            self.progress(message)
+
+    def old_sessions(self):
+        """
+        Ids of sessions in the live DB older than max_age_days, oldest first.
+        """
+        cutoff = (datetime.now() - timedelta(days=self.max_age_days)).strftime(DATETIME_FMT)
+        sessions = self.db.db.execute(
+            """
+            SELECT id
+            FROM main.session
+            WHERE datetime < ?
+            ORDER BY datetime
+            """,
+            [cutoff]
+        ).fetchall()
+        return [session_id for session_id, in sessions]
+
+    def time_queries(self, repeats=5):
+        """
+        Average wall time (s) of the queries whose cost grows with the live DB.
+        """
+        start = time.perf_counter()
+        for _ in range(repeats):
+            self.db.get_sessions_list()
+            self.db.db.execute(
+                "SELECT COUNT(*) FROM main.item WHERE item = ?",
+                ["__not_an_item__"]
+            ).fetchall()
+        return (time.perf_counter() - start) / repeats
+
+    def archive(self):
+        """
+        Archive old sessions and compact the live DB.
+        """
+        size_before = self.db.database_size()
+        query_time_before = self.time_queries()
+
+        session_ids = self.old_sessions()
+        periods = []
+        if session_ids:
+            self.report_progress("Archiving {} sessions older than {} days".format(
+                len(session_ids), self.max_age_days
+            ))
+        for start in range(0, len(session_ids), ARCHIVE_BATCH_SIZE):
+            for period in self.move_sessions(session_ids[start:start + ARCHIVE_BATCH_SIZE]):
+                if period not in periods:
+                    periods.append(period)
+            self.report_progress("Archived {} of {} sessions".format(
+                min(start + ARCHIVE_BATCH_SIZE, len(session_ids)), len(session_ids)
+            ))
+        if session_ids:
+            self.report_progress("Compacting {}".format(self.db.dbfile))
+            self.db.compact()
+
+        report = ArchiveReport(
+            sessions_archived=len(session_ids),
+            periods=periods,
+            archive=str(self.db.archive),
+            size_before=size_before,
+            size_after=self.db.database_size(),
+            query_time_before=query_time_before,
+            query_time_after=self.time_queries(),
+        )
+        logging.info("Archived %s sessions: %s", report.sessions_archived, report)
+        return report
+
+    def move_sessions(self, session_ids):
+        """
+        Move all rows belonging to session_ids from the live DB into the
+        archive. Returns the periods the sessions belong to.
+
+        SQLite does not commit a WAL database and its attached databases
+        atomically, so the rows are first copied and the archive committed,
+        then deleted from the live DB in a second transaction. Copying
+        replaces whatever an interrupted earlier move left in the archive,
+        so a session found in both is simply moved again.
+        """
+        self.db.attach_archive()
+        logging.info("Moving %s sessions to the archive", len(session_ids))
+        self.db.db.executescript(
+            """
+            DROP TABLE IF EXISTS temp.archive_session;
+            CREATE TEMP TABLE archive_session (id TEXT PRIMARY KEY);
+            """
+        )
+        self.db.db.executemany(
+            "INSERT INTO temp.archive_session VALUES (?)",
+            [(session_id,) for session_id in session_ids]
+        )
+        with self.db.db:
+            for table, session_column, columns in ARCHIVED_TABLES:
+                if table == "session":
+                    target_columns = columns + ", period"
+                    select = columns + ", substr(datetime, 1, {})".format(PERIOD_LENGTH[self.period])
+                else:
+                    target_columns = select = columns
+                self.db.db.execute(
+                    """
+                    DELETE FROM archive.{table}
+                    WHERE {session_column} IN (SELECT id FROM temp.archive_session)
+                    """.format(table=table, session_column=session_column)
+                )
+                self.db.db.execute(
+                    """
+                    INSERT OR IGNORE INTO archive.{table} ({target_columns})
+                    SELECT {select}
+                    FROM main.{table}
+                    WHERE {session_column} IN (SELECT id FROM temp.archive_session)
+                    """.format(table=table, target_columns=target_columns, select=select,
+                        session_column=session_column)
+                )
+        with self.db.db:
+            for table, session_column, _ in ARCHIVED_TABLES:
+                self.db.db.execute(
+                    """
+                    DELETE FROM main.{table}
+                    WHERE {session_column} IN (SELECT id FROM temp.archive_session)
+                    """.format(table=table, session_column=session_column)
+                )
+        periods = self.db.db.execute(
+            """
+            SELECT DISTINCT period
+            FROM archive.session
+            WHERE id IN (SELECT id FROM temp.archive_session)
+            ORDER BY period
+            """
+        ).fetchall()
+        self.db.db.execute("DROP TABLE temp.archive_session")
+        return [period for period, in periods]